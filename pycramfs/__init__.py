@@ -1,15 +1,16 @@
 from __future__ import annotations
 
 import io
-from functools import partial
+import mmap
+import os
+import threading
 from pathlib import PurePosixPath
-from typing import TYPE_CHECKING, Any, BinaryIO, Iterator, Optional
-from zlib import crc32
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterator, Optional
 
 from pycramfs.const import CRC_OFFSET, CRC_SIZE
-from pycramfs.file import Directory, File
+from pycramfs.file import Directory, File, path_parts
 from pycramfs.structure import Super
-from pycramfs.util import BoundedSubStream, test_super
+from pycramfs.util import BoundedSubStream, crc32, parallel_crc32, real_fileno, test_super
 
 if TYPE_CHECKING:
     from pycramfs.types import ByteStream, FileDescriptorOrPath, ReadableBuffer, StrPath
@@ -19,6 +20,8 @@ __version__ = "1.1.0"
 
 class Cramfs:
 
+    __slots__ = ("_fd", "_super", "_rootdir", "_closefd", "_lock", "_paths", "_mmap", "_view", "_fileno")
+
     def __init__(
         self,
         fd: ByteStream,
@@ -30,6 +33,11 @@ class Cramfs:
         self._super = super
         self._rootdir = rootdir
         self._closefd = closefd
+        self._lock = threading.Lock()  # Guards seek/read pairs on fd
+        self._paths: Optional[Dict[str, File]] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None  # The image when memory-mapped
+        self._fileno: Optional[int] = None  # Set to read with os.pread() instead
 
     def __enter__(self):
         return self
@@ -68,24 +76,75 @@ class Cramfs:
         return self._super.size
 
     def close(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:  # A slice is still alive, it will be closed when collected
+                pass
+            self._mmap = None
+        # Not a real file (or a compressed one) or already closed if None.
+        if hasattr(os, "posix_fadvise") and (fileno := real_fileno(self._fd)) is not None:
+            # The image won't be read again, free its pages from the cache.
+            os.posix_fadvise(fileno, self._fd.start, self._super.size, os.POSIX_FADV_DONTNEED)  # type: ignore
+        self._fileno = None  # The number could be reused by another file
         self._fd.close()
 
     def find(self, filename: StrPath) -> Optional[File]:
         return self._rootdir.find(filename)
 
     def select(self, path: StrPath) -> Optional[File]:
-        return self._rootdir.select(path)
+        """Select a file of any kind by path.
+
+        Lookups go through an index of all the paths in the image
+        that is built on first use (the image is read-only).
+        """
+        parts = path_parts(os.fspath(path))
+        if ".." in parts:
+            return self._rootdir._select_parts(parts)
+        if self._paths is None:
+            self._paths = {str(file.path): file for file in self._rootdir.riter()}
+        return self._paths.get('/' + '/'.join(parts))
 
     def itermatch(self, pattern: str) -> Iterator[File]:
         yield from self._rootdir.itermatch(pattern)
 
+    def _read(self, offset: int, size: int) -> ReadableBuffer:
+        """Read `size` bytes at `offset`, without copying them when memory-mapped."""
+        if self._view is not None:
+            return self._view[offset:offset + size]
+        if self._fileno is not None:  # No seek and no lock needed
+            size = max(0, min(size, self._super.size - offset))  # Stay within the image
+            return os.pread(self._fileno, size, self._fd.start + offset)  # type: ignore
+        with self._lock:  # Files may be read from multiple threads
+            self._fd.seek(offset)
+            return self._fd.read(size)
+
     def calculate_crc(self, size: int = 1024**2) -> int:
+        """Calculate the CRC32 of the file system, reading `size` bytes at a time.
+
+        Keep `size` large: vectorized crc32 implementations
+        are only faster than table-based ones on long buffers.
+        When the image is memory-mapped, it is split in slices
+        of at least `size` bytes whose CRCs are calculated in parallel.
+        """
+        if self._view is not None:
+            crc = crc32(self._view[:CRC_OFFSET])
+            crc = crc32(bytes(CRC_SIZE), crc)
+            with self._view[CRC_OFFSET + CRC_SIZE:] as data:
+                return parallel_crc32(data, crc, size)
         self._fd.seek(0)
         crc = crc32(self._fd.read(CRC_OFFSET))  # Read until CRC
         self._fd.read(CRC_SIZE)  # Read the CRC but ignore it
         crc = crc32(bytes(CRC_SIZE), crc)  # and "replace" it by NULL bytes
-        for block in iter(partial(self._fd.read, size), b''):
-            crc = crc32(block, crc)
+        # Reuse the same buffer for every block and avoid lookups in the loop.
+        buffer = bytearray(size)
+        readinto, crc32_ = self._fd.readinto, crc32  # type: ignore
+        with memoryview(buffer) as view:
+            while n := readinto(buffer):
+                crc = crc32_(view[:n], crc)
         return crc
 
     @classmethod
@@ -99,6 +158,16 @@ class Cramfs:
         test_super(super)
         fd_ = BoundedSubStream(fd, offset, offset + super.size)
         self = cls(fd_, super, None, closefd)  # type: ignore
+        # Map real files to read them without syscalls or copies.
+        if (fileno := real_fileno(fd)) is not None:
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            try:
+                self._mmap = mmap.mmap(fileno, offset - start + super.size, access=mmap.ACCESS_READ, offset=start)
+            except (OSError, ValueError):  # Truncated image
+                if hasattr(os, "pread"):  # Not available on Windows
+                    self._fileno = fileno
+            else:
+                self._view = memoryview(self._mmap)[offset - start:]
         self._rootdir = Directory.from_fd(fd_, self, self._super.root)
         return self
 
@@ -108,4 +177,8 @@ class Cramfs:
 
     @classmethod
     def from_file(cls, file: FileDescriptorOrPath, offset: int = 0):
-        return cls.from_fd(open(file, "rb"), offset)
+        fd = open(file, "rb")
+        if hasattr(os, "posix_fadvise"):  # Not available on Windows
+            # Computing the CRC and extracting both read the image sequentially.
+            os.posix_fadvise(fd.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL)
+        return cls.from_fd(fd, offset)
@@ -1,3 +1,5 @@
+import stat
+import sys
 from argparse import ArgumentParser, Namespace
 from pathlib import Path, PurePosixPath
 
@@ -9,32 +11,30 @@ from pycramfs.file import Directory, File, Symlink, filetype
 from pycramfs.util import find_superblocks, printq
 
 
-def print_file(file: File) -> None:
+def format_file(file: File) -> str:
     # Max file size is 2**24-1 or 16777215 -> 8 characters.
     # Max UID is 2**16-1 or 65535 -> 5 characters.
     # Max GID is 2**8-1 or 255 -> 3 characters.
     link = f"-> {file.readlink()}" if isinstance(file, Symlink) else ''
-    print(file.filemode, f"{file.size:8} {file.uid:5}:{file.gid:<3}", file.path, link)
+    return f"{file.filemode} {file.size:8} {file.uid:5}:{file.gid:<3} {file.path} {link}\n"
 
 
 def list_(args: Namespace) -> None:
     if (types := args.type) is not None:
         types = set(''.join(types).replace('f', '-'))
-    count = 0
     with Cramfs.from_file(args.file, args.offset) as cramfs:
         if args.pattern is None:
             it = cramfs
         else:
             it = cramfs.itermatch(args.pattern)
-        if types is None:
-            for file in it:
-                print_file(file)
-                count += 1
-        else:
-            for file in it:
-                if file.filemode[0] in types:
-                    print_file(file)
-                    count += 1
+        if types is not None:
+            it = (file for file in it if file.filemode[0] in types)
+        # Writing preformatted lines saves print()'s separate writes for sep and end.
+        write = sys.stdout.write
+        count = 0
+        for file in it:
+            write(format_file(file))
+            count += 1
     print(f"{count} file(s) found")
 
 
@@ -83,33 +83,36 @@ def extract(args: Namespace) -> None:
 def check(args: Namespace) -> None:
     with Cramfs.from_file(args.file, args.offset) as cramfs:
         for file in cramfs:
-            if file.inode.namelen == 0 and str(file.path) != '/':
+            # Read the inode's fields once. The path is only built when printed.
+            inode = file.inode
+            mode, size, offset = inode.mode, inode.size, inode.offset
+            fmt = stat.S_IFMT(mode)
+            if inode.namelen == 0 and file.parent is not None:
                 print("filename length is zero", file.path)
-            offset = file.inode.offset
-            if file.is_dir:
-                if offset == 0 and file.size != 0:
+            if fmt == stat.S_IFDIR:
+                if offset == 0 and size != 0:
                     print("directory inode has zero offset and non-zero size:", file.path)
-            elif file.is_file:
-                if offset == 0 and file.size != 0:
+            elif fmt == stat.S_IFREG:
+                if offset == 0 and size != 0:
                     print("file inode has zero offset and non-zero size", file.path)
-                if file.size == 0 and offset != 0:
+                if size == 0 and offset != 0:
                     print("file inode has zero size and non-zero offset", file.path)
-            elif file.is_symlink:
+            elif fmt == stat.S_IFLNK:
                 if offset == 0:
                     print("symbolic link has zero offset", file.path)
-                if file.size == 0:
+                if size == 0:
                     print("symbolic link has zero size", file.path)
             else:
                 if offset != 0:
                     print("special file has non-zero offset:", file.path)
-                if file.is_char_device or file.is_block_device:
+                if fmt == stat.S_IFCHR or fmt == stat.S_IFBLK:
                     pass
-                elif file.is_fifo or file.is_socket:
-                    typ = "fifo" if file.is_fifo else "socket"
-                    if file.size != 0:
+                elif fmt == stat.S_IFIFO or fmt == stat.S_IFSOCK:
+                    typ = "fifo" if fmt == stat.S_IFIFO else "socket"
+                    if size != 0:
                         print(f"{typ} has non-zero size: {file.path}")
                 else:
-                    print(f"bogus mode: {file.path} ({file.mode:o})")
+                    print(f"bogus mode: {file.path} ({mode:o})")
 
 
 def main():
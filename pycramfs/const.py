@@ -1,3 +1,4 @@
+import struct
 from enum import IntEnum, IntFlag
 from typing import Final
 
@@ -28,7 +29,8 @@ class Flag(IntFlag):
     EXT_BLOCK_POINTERS = 0x00000800  # block pointer extensions
 
 
-SUPPORTED_FLAGS = (
+# Masks are plain ints so that using them doesn't go through IntFlag.__and__.
+SUPPORTED_FLAGS: Final = int(
     0xFF
     | Flag.HOLES
     | Flag.WRONG_SIGNATURE
@@ -42,12 +44,21 @@ class BlockFlag(IntFlag):
     DIRECT_PTR = 1 << 30
 
 
-BLK_FLAGS: Final = BlockFlag.UNCOMPRESSED | BlockFlag.DIRECT_PTR
+UNCOMPRESSED_MASK: Final = int(BlockFlag.UNCOMPRESSED)
+DIRECT_PTR_MASK: Final = int(BlockFlag.DIRECT_PTR)
+BLK_FLAGS: Final = UNCOMPRESSED_MASK | DIRECT_PTR_MASK
 
+SIGNATURE_OFFSET: Final = 16  # Bytes
 CRC_OFFSET: Final = 32  # Bytes
 CRC_SIZE: Final = 4  # Bytes
+CRC_POLY: Final = 0xEDB88320  # Reversed CRC-32 polynomial
 
 BLK_PTR_FMT: Final = "<I"
 
+# Superblock layout (magic, size, flags, future, signature, fsid, name, root)
+# to decode it without going through the ctypes structures.
+SUPER_FMT: Final = "<4I16s4I16s3I"
+SUPER: Final = struct.Struct(SUPER_FMT)
+
 MAGIC_BYTES: Final = MAGIC.to_bytes(4, "little")
 SIGNATURE_BYTES: Final = b"Compressed ROMFS"
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import os
 import stat
-from os import chmod, utime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import chmod, cpu_count, utime
 from pathlib import Path
+from time import monotonic
 from typing import TYPE_CHECKING, Optional
 
 from pycramfs.const import Width
@@ -18,7 +21,7 @@ from pycramfs.file import (
     Symlink
 )
 from pycramfs.structure import Inode
-from pycramfs.util import printq
+from pycramfs.util import printer, printq
 
 if TYPE_CHECKING:
     from pycramfs.types import StrOrBytesPath
@@ -31,15 +34,16 @@ except ImportError:
 
 
 def write_file(path: Path, file: Optional[DataFile] = None, force: bool = False) -> int:
-    if force or not path.exists():
-        written = 0
-        with path.open("wb") as f:
-            if file is not None:
-                for block in file.iter_bytes():
-                    written += f.write(block)
-        return written
-    else:
-        raise FileExistsError(f"{path.resolve()} already exists")
+    # Let the OS check for existence instead of calling path.exists() first.
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    if not force:
+        flags |= os.O_EXCL
+    try:
+        fd = os.open(path, flags, 0o666)
+    except FileExistsError:
+        raise FileExistsError(f"{path.resolve()} already exists") from None
+    with open(fd, "wb") as f:
+        return file.copy_to(f) if file is not None else 0
 
 
 try:
@@ -98,19 +102,43 @@ def extract_file(file: File, dest: Path, force: bool = False, quiet: bool = True
 
 
 def extract_dir(directory: Directory, dest: Path, force: bool = False, quiet: bool = True) -> int:
-    """Extract a directory tree. Return the amount of files created."""
+    """Extract a directory tree. Return the amount of files created.
+
+    Directories are created first, then the other files are extracted in parallel.
+    """
     total = directory.total
     width = 2**Width.NAMELEN
     count = created = -1  # Account for creation of destination directory
+    last_print = 0.0
+    print_ = printer(quiet)
+
+    def progress(file: File) -> None:
+        nonlocal count, last_print
+        count += 1
+        # Printing for every file would cost more than extracting small files.
+        if count == total or monotonic() - last_print > 0.05:
+            last_print = monotonic()
+            print_(f"{count}/{total} {file.name:{width}}", end='\r')
+
+    files = []
     for file in directory.riter():
         path = dest / file.path.relative_to(directory.path)
         if file.is_dir:
             path.mkdir(file.mode, exist_ok=force)
             change_file_status(path, file.inode)
             created += 1
+            progress(file)
         else:
-            created += extract_file(file, path, force, quiet)
-        count += 1
-        printq(f"{count}/{total} {file.name:{width}}", end='\r', quiet=quiet)
-    printq(quiet=quiet)
+            files.append((file, path))
+    with ThreadPoolExecutor(cpu_count()) as executor:
+        futures = {executor.submit(extract_file, file, path, force, quiet): file for file, path in files}
+        try:
+            for future in as_completed(futures):
+                created += future.result()
+                progress(futures[future])
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    print_()
     return created
@@ -1,23 +1,51 @@
 from __future__ import annotations
 
 import fnmatch
+import os
+import re
+import stat
 import struct
-import zlib
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import sizeof
 from pathlib import PurePosixPath
-from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Literal, Optional, Tuple
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterable, Iterator, List, Literal, Optional, Set, Tuple
 
-from pycramfs.const import BLK_FLAGS, BLK_PTR_FMT, PAGE_SIZE, BlockFlag
+from pycramfs.const import BLK_FLAGS, BLK_PTR_FMT, DIRECT_PTR_MASK, PAGE_SIZE, UNCOMPRESSED_MASK
 from pycramfs.exception import CramfsError
 from pycramfs.structure import Inode
+from pycramfs.util import real_fileno
 
 if TYPE_CHECKING:
     from pycramfs import Cramfs
-    from pycramfs.types import ByteStream, StrPath
+    from pycramfs.types import ByteStream, ReadableBuffer, StrPath, WriteableBuffer
+
+try:
+    # libdeflate and ISA-L inflate two to three times as fast as zlib.
+    from deflate import zlib_decompress  # type: ignore
+except ImportError:
+    try:
+        from isal.isal_zlib import decompress  # type: ignore
+    except ImportError:
+        from zlib import decompress
+else:
+    def decompress(data: ReadableBuffer) -> bytes:
+        # A block is never larger than a page once decompressed.
+        return zlib_decompress(data, PAGE_SIZE)
+
+
+def path_parts(path: str) -> List[str]:
+    """Split a path on `'/'`, dropping empty and `'.'` components."""
+    return [part for part in path.split('/') if part and part != '.']
 
 
 class File:
     """Abstract base class for files."""
 
+    __slots__ = ("_fd", "_image", "_inode", "_name", "_parent", "_name_str", "_path")
+
     def __init__(
         self,
         fd: ByteStream,
@@ -31,6 +59,8 @@ class File:
         self._inode = inode
         self._name = name
         self._parent = parent
+        self._name_str = name.decode()
+        self._path: Optional[PurePosixPath] = None
 
     def __str__(self) -> str:
         return self.name
@@ -58,7 +88,7 @@ class File:
 
     @property
     def name(self) -> str:
-        return self._name.decode()
+        return self._name_str
 
     @property
     def parent(self) -> Optional[Directory]:
@@ -67,9 +97,12 @@ class File:
     @property
     def path(self) -> PurePosixPath:
         """Return the file's absolute path."""
-        if self._parent is None:
-            return PurePosixPath('/')
-        return self._parent.path / self.name
+        if self._path is None:
+            if self._parent is None:
+                self._path = PurePosixPath('/')
+            else:
+                self._path = self._parent.path / self._name_str
+        return self._path
 
     @property
     def mode(self) -> int:
@@ -130,6 +163,8 @@ class File:
 
 class Directory(File):
 
+    __slots__ = ("_files", "_total")
+
     def __init__(
         self,
         fd: ByteStream,
@@ -141,7 +176,7 @@ class Directory(File):
     ) -> None:
         super().__init__(fd, image, inode, name, parent)
         self._files = files if files is not None else {}
-        self._total = None
+        self._total: Optional[int] = None
 
     def __len__(self) -> int:
         return len(self._files)
@@ -204,78 +239,199 @@ class Directory(File):
         The path can be absolute or relative.
         Special entries `'.'` and `'..'` are supported.
         """
-        path = PurePosixPath(path)
-        if str(path) == "..":
-            return self.parent if self.parent is not None else self
-        if path.root == '/':
-            if str(self.path) == '/':
-                path = path.relative_to('/')
+        path = os.fspath(path)
+        if path.startswith('/') and self._parent is not None:
+            return self._image.rootdir.select(path)
+        return self._select_parts(path_parts(path))
+
+    def _select_parts(self, parts: List[str]) -> Optional[File]:
+        file: Optional[File] = self
+        for part in parts:
+            if not isinstance(file, Directory):
+                return None
+            if part == "..":
+                file = file._parent if file._parent is not None else file
             else:
-                return self._image.rootdir.select(path)
-        if str(path) == '.':
-            return self
-        child, *descendants = path.parts
-        if (file := self._files.get(child, None)) is not None:
-            if isinstance(file, Directory) and descendants:
-                return file.select(PurePosixPath(*descendants))
-            elif not descendants:
-                return file
-        return None
+                file = file._files.get(part)
+        return file
 
     def itermatch(self, pattern: str) -> Iterator[File]:
         """Iterate over files in this subtree that (fn)match the pattern."""
-        # We must use str() here because filter doesn't call normcase on Posix.
-        if str(self.path) == '/':
-            paths = (str(file.path) for file in self.riter())
-        else:
-            paths = (str(file.path.relative_to(self.path)) for file in self.riter())
-        for path in fnmatch.filter(paths, pattern):
-            yield self.select(path)  # type: ignore
+        # Same as fnmatch.filter() on Posix (no normcase) but yields
+        # the files directly instead of selecting their path afterwards.
+        match = re.compile(fnmatch.translate(pattern)).match
+        path = str(self.path)
+        # Paths are absolute from the root directory and relative otherwise.
+        start = 0 if path == '/' else len(path) + 1
+        for file in self.riter():
+            if match(str(file.path)[start:] or '.'):
+                yield file
 
     @classmethod
     def from_fd(cls, fd: ByteStream, image: Cramfs, inode: Inode, name: bytes = b'') -> Directory:
         self = cls(fd, image, inode, name)
-        if inode.offset == 0:  # Empty dir
-            return self
-        fd.seek(inode.offset)
-        end = inode.size + inode.offset
-        children: List[Tuple[Inode, bytes]] = []
-        while fd.tell() != end:
-            ino = Inode.from_fd(fd)
-            name = fd.read(ino.namelen).rstrip(b'\x00')
-            children.append((ino, name))
-        for ino, name in children:
-            if ino.is_dir:
-                file = Directory.from_fd(fd, image, ino, name)
-                file._parent = self
-            else:
-                cls = filetype[ino.filemode[0]]
-                file = cls(fd, image, ino, name, self)
-            self._files[name.decode()] = file
+        inode_size = sizeof(Inode)
+        parse, S_IFMT = Inode.from_buffer_copy, stat.S_IFMT  # Avoid lookups in the loop
+        # Walk the tree with a work list instead of recursing into subdirectories.
+        todo = deque([self])
+        directories: List[Directory] = []  # In breadth-first order
+        seen: Set[int] = set()  # Offsets of the entries parsed so far
+        while todo:
+            directory = todo.popleft()
+            directories.append(directory)
+            offset = directory._inode.offset
+            if offset == 0:  # Empty dir
+                directory._total = 0
+                continue
+            # A malformed image could make a directory contain itself or an ancestor.
+            if offset in seen:
+                raise CramfsError(f"entries of {directory.path} were already read for another directory")
+            seen.add(offset)
+            # Read all the entries at once and parse them from memory.
+            data = image._read(offset, directory._inode.size)
+            files, pos, end = directory._files, 0, len(data)
+            while pos < end:
+                ino = parse(data, pos)
+                pos += inode_size
+                namelen = ino._namelen * 4
+                name = bytes(data[pos:pos + namelen]).rstrip(b'\x00')
+                pos += namelen
+                file = fmttype[S_IFMT(ino._mode)](fd, image, ino, name, directory)
+                files[file._name_str] = file
+                if isinstance(file, Directory):
+                    todo.append(file)
+            directory._total = len(files)
+        # Children come after their parent so this adds each subtree's total to its parent.
+        for directory in reversed(directories[1:]):
+            directory._parent._total += directory._total  # type: ignore
         return self
 
 
 class DataFile(File):
 
-    def iter_bytes(self) -> Iterator[bytes]:
-        """Read blocks and decompress them if necessary."""
+    __slots__ = ()
+
+    def iter_blocks(self) -> Iterator[Tuple[int, int, bool]]:
+        """Iterate over the data blocks' position, length and compression status."""
         maxblock = (self._inode.size + PAGE_SIZE - 1) // PAGE_SIZE
-        self._fd.seek(self._inode.offset)
-        block_pointers = self._fd.read(struct.calcsize(BLK_PTR_FMT) * maxblock)
-        for block_ptr, *_ in struct.iter_unpack(BLK_PTR_FMT, block_pointers):
-            uncompressed = block_ptr & BlockFlag.UNCOMPRESSED
-            direct = block_ptr & BlockFlag.DIRECT_PTR
-            if direct:
-                raise CramfsError("Only contiguous data layout supported")
-            block_ptr &= ~BLK_FLAGS  # Remove potential block pointer flags
-            block_len = block_ptr - self._fd.tell()
-            data = self._fd.read(block_len)
-            if not uncompressed:
-                data = zlib.decompress(data)
-            yield data
+        size = struct.calcsize(BLK_PTR_FMT) * maxblock
+        # Decode the whole table in one call rather than one tuple per pointer.
+        pointers = array("I")  # 32-bit unsigned on all supported platforms
+        pointers.frombytes(self._image._read(self._inode.offset, size))
+        if sys.byteorder == "big":
+            pointers.byteswap()
+        if any(block_ptr & DIRECT_PTR_MASK for block_ptr in pointers):
+            raise CramfsError("Only contiguous data layout supported")
+        start = self._inode.offset + size
+        for block_ptr in pointers:
+            end = block_ptr & ~BLK_FLAGS  # Remove potential block pointer flags
+            yield start, end - start, not block_ptr & UNCOMPRESSED_MASK
+            start = end
+
+    def _iter_runs(self, batch: int) -> Iterator[Tuple[int, List[int], bool]]:
+        """Group consecutive blocks that are all compressed or all uncompressed,
+        at most `batch` at a time.
+
+        Yield the position of the run, the length of each of its blocks
+        and whether they are compressed.
+        """
+        lengths: List[int] = []
+        run_start, run_compressed = 0, True  # Set with the first block of each run
+        for offset, length, compressed in self.iter_blocks():
+            if lengths and (compressed != run_compressed or len(lengths) == batch):
+                yield run_start, lengths, run_compressed
+                lengths = []
+            if not lengths:
+                run_start, run_compressed = offset, compressed
+            lengths.append(length)
+        if lengths:
+            yield run_start, lengths, run_compressed
+
+    def _decode_run(self, offset: int, lengths: List[int], compressed: bool) -> Iterator[bytes]:
+        """Read a run of blocks at once and decompress them if necessary.
+
+        Compressed blocks are decompressed from slices of the run
+        and uncompressed runs are yielded as a whole.
+        """
+        data = self._image._read(offset, sum(lengths))
+        if not compressed:
+            yield bytes(data)  # Already the run's content, don't copy it block by block
+            return
+        view = memoryview(data)
+        pos = 0
+        for length in lengths:
+            yield decompress(view[pos:pos + length])
+            pos += length
+
+    def iter_bytes(self, batch: int = 16) -> Iterator[bytes]:
+        """Read blocks and decompress them if necessary.
+
+        Up to `batch` blocks are read from the image at once.
+        """
+        for run in self._iter_runs(batch):
+            yield from self._decode_run(*run)
+
+    def copy_to(self, fd: BinaryIO, batch: int = 16) -> int:
+        """Write this file's content to `fd`. Return the amount of bytes written.
+
+        When both are real files, uncompressed blocks are copied
+        by the kernel with `os.copy_file_range` (Linux only).
+        """
+        copy_file_range = getattr(os, "copy_file_range", None)
+        if copy_file_range is not None:
+            src, dst, base = real_fileno(self._fd), real_fileno(fd), self._fd.start  # type: ignore
+            if src is None or dst is None:  # Not real files (or compressed ones)
+                copy_file_range = None
+        written = 0
+        for offset, lengths, compressed in self._iter_runs(batch):
+            if not compressed and copy_file_range is not None:
+                length = sum(lengths)
+                fd.flush()
+                pos = fd.tell()
+                try:
+                    copied = copy_file_range(src, dst, length, base + offset, pos)
+                except OSError:  # Cross-device copies are refused by some kernels
+                    copy_file_range = None
+                else:
+                    fd.seek(pos + copied)
+                    written += copied
+                    if copied == length:
+                        continue
+                    offset, lengths = offset + copied, [length - copied]
+            for block in self._decode_run(offset, lengths, compressed):
+                written += fd.write(block)
+        return written
+
+    def readinto(self, buffer: WriteableBuffer, offset: int = 0, batch: int = 16) -> int:
+        """Read the whole file into `buffer` at `offset`. Return the amount of bytes read.
+
+        This avoids allocating the file's content when a buffer can be reused.
+        """
+        view = memoryview(buffer).cast('B')
+        if len(view) - offset < self._inode.size:
+            raise ValueError("buffer is too small")
+        pos = offset
+        for start, lengths, compressed in self._iter_runs(batch):
+            if compressed:
+                blocks: Iterable[ReadableBuffer] = self._decode_run(start, lengths, compressed)
+            else:  # Copy straight from the image
+                blocks = [self._image._read(start, sum(lengths))]
+            for block in blocks:
+                size = len(block)  # type: ignore
+                view[pos:pos + size] = block
+                pos += size
+        return pos - offset
 
     def read_bytes(self) -> bytes:
-        return b''.join(self.iter_bytes())
+        """Read the whole file.
+
+        Runs of blocks of large files are decompressed in parallel.
+        """
+        if self._inode.size <= 64 * PAGE_SIZE:  # Not worth starting threads
+            return b''.join(self.iter_bytes())
+        with ThreadPoolExecutor(os.cpu_count()) as executor:
+            runs = executor.map(lambda run: b''.join(self._decode_run(*run)), self._iter_runs(16))
+            return b''.join(runs)
 
     def read_text(self, encoding: str = "utf8", errors: str = "strict") -> str:
         return self.read_bytes().decode(encoding, errors)
@@ -283,6 +439,8 @@ class DataFile(File):
 
 class RegularFile(DataFile):
 
+    __slots__ = ()
+
     @property
     def is_file(self) -> Literal[True]:
         return True
@@ -290,6 +448,8 @@ class RegularFile(DataFile):
 
 class Symlink(DataFile):
 
+    __slots__ = ()
+
     @property
     def is_symlink(self) -> Literal[True]:
         return True
@@ -300,6 +460,8 @@ class Symlink(DataFile):
 
 class FIFO(File):
 
+    __slots__ = ()
+
     @property
     def is_fifo(self) -> Literal[True]:
         return True
@@ -307,6 +469,8 @@ class FIFO(File):
 
 class Socket(File):
 
+    __slots__ = ()
+
     @property
     def is_socket(self) -> Literal[True]:
         return True
@@ -314,6 +478,8 @@ class Socket(File):
 
 class CharacterDevice(File):
 
+    __slots__ = ()
+
     @property
     def is_char_device(self) -> Literal[True]:
         return True
@@ -321,6 +487,8 @@ class CharacterDevice(File):
 
 class BlockDevice(File):
 
+    __slots__ = ()
+
     @property
     def is_block_device(self) -> Literal[True]:
         return True
@@ -335,3 +503,14 @@ filetype = {
     'b': BlockDevice,
     'c': CharacterDevice
 }
+
+# Same as filetype but keyed by stat.S_IFMT(mode), which is much cheaper than filemode.
+fmttype = {
+    stat.S_IFREG: RegularFile,
+    stat.S_IFDIR: Directory,
+    stat.S_IFLNK: Symlink,
+    stat.S_IFIFO: FIFO,
+    stat.S_IFSOCK: Socket,
+    stat.S_IFBLK: BlockDevice,
+    stat.S_IFCHR: CharacterDevice
+}
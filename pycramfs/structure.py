@@ -25,7 +25,14 @@ class _Base(LittleEndianStructure):
 
     @classmethod
     def from_fd(cls, fd: ByteStream):
-        return cls.from_bytes(fd.read(sizeof(cls)))
+        readinto = getattr(fd, "readinto", None)
+        if readinto is None:
+            return cls.from_bytes(fd.read(sizeof(cls)))
+        # Structures are writable buffers, fill one without an intermediate bytes.
+        self = cls()
+        if (size := readinto(self)) < sizeof(cls):
+            raise ValueError(f"Buffer size too small ({size} instead of at least {sizeof(cls)} bytes)")
+        return self
 
 
 class Inode(_Base):
@@ -7,6 +7,7 @@ from pycramfs.util import BoundedSubStream
 
 ByteStream = Union[BinaryIO, BoundedSubStream[bytes]]
 ReadableBuffer = Union[bytes, bytearray, memoryview]
+WriteableBuffer = Union[bytearray, memoryview]
 StrOrBytesPath = Union[str, bytes, PathLike[str], PathLike[bytes]]
 FileDescriptorOrPath = Union[int, StrOrBytesPath]
 StrPath = Union[str, PathLike[str]]
@@ -1,17 +1,36 @@
 from __future__ import annotations
 
 import io
-from functools import partial
+import mmap
+import os
+import stat
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import TYPE_CHECKING, IO, Any, AnyStr, List, Optional, Set, Union
+from typing import TYPE_CHECKING, IO, Any, AnyStr, BinaryIO, Callable, List, Optional, Tuple, Union
 
-from pycramfs.const import MAGIC, MAGIC_BYTES, SIGNATURE, SIGNATURE_BYTES, SUPPORTED_FLAGS, Flag
+from pycramfs.const import (
+    CRC_POLY,
+    MAGIC,
+    PAGE_SIZE,
+    SIGNATURE_BYTES,
+    SIGNATURE_OFFSET,
+    SUPER,
+    SUPPORTED_FLAGS,
+    Flag,
+    Width,
+)
 from pycramfs.exception import CramfsError
-from pycramfs.file import PAGE_SIZE
 from pycramfs.structure import Super
 
 if TYPE_CHECKING:
-    from pycramfs.types import FileDescriptorOrPath, ReadableBuffer, StructAsDict
+    from pycramfs.types import FileDescriptorOrPath, ReadableBuffer, StructAsDict, WriteableBuffer
+
+try:
+    # ISA-L's crc32 uses PCLMULQDQ folding and is much faster than zlib's.
+    from isal.isal_zlib import crc32  # type: ignore
+except ImportError:
+    from zlib import crc32
 
 
 class BoundedSubStream(IO[AnyStr]):
@@ -19,99 +38,332 @@ class BoundedSubStream(IO[AnyStr]):
     to move before the start or past the end of a sub stream.
     """
 
+    __slots__ = ("_fd", "_read", "_tell", "_start", "_end", "_unbounded")
+
     def __init__(self, fd: IO[AnyStr], start: int = 0, end: Optional[int] = None) -> None:
         """`start` and `end` are the absolute limits of the sub stream.
 
         `end` will usually be `start` + data size.
         """
         self._fd = fd
+        # Called for every read.
+        self._read: Callable[..., AnyStr] = fd.read
+        self._tell: Callable[[], int] = fd.tell
         self._start = start
-        self._end = end if end is not None else self._find_size()
+        # Reads don't need to be bounded if the sub stream covers the whole stream.
+        if end is None:
+            self._end = self._find_size()
+            self._unbounded = start == 0
+        else:
+            self._end = end
+            # Only check when the size is cheap to get, compressed streams
+            # would have to be decompressed entirely to seek to their end.
+            size = self._file_size()
+            self._unbounded = start == 0 and size is not None and end >= size
 
     def __getattr__(self, name: str) -> Any:
         # Treat anything else as if called directly on the wrapped stream.
+        # Methods used when reading an image are defined or bound in __init__
+        # so they don't get here.
         return getattr(self._fd, name)
 
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    # IO defines these so __getattr__ wouldn't be called.
+
+    @property
+    def closed(self) -> bool:
+        return self._fd.closed
+
+    def close(self) -> None:
+        self._fd.close()
+
+    def fileno(self) -> int:
+        return self._fd.fileno()
+
+    @property
+    def name(self) -> Any:
+        return self._fd.name
+
+    @property
+    def mode(self) -> str:
+        return self._fd.mode
+
+    def flush(self) -> None:
+        self._fd.flush()
+
+    def isatty(self) -> bool:
+        return self._fd.isatty()
+
+    def readable(self) -> bool:
+        return self._fd.readable()
+
+    def seekable(self) -> bool:
+        return self._fd.seekable()
+
+    def writable(self) -> bool:
+        return False  # Writes are not bounded
+
+    def _file_size(self) -> Optional[int]:
+        """Return the size of the wrapped stream if it's a regular file, else None."""
+        if (fileno := real_fileno(self._fd)) is not None:  # Not for compressed files either
+            st = os.fstat(fileno)
+            if stat.S_ISREG(st.st_mode):  # Block devices have a size of 0
+                return st.st_size  # One syscall and no seeks
+        return None
+
     def _find_size(self) -> int:
+        if (size := self._file_size()) is not None:
+            return size
         pos = self._fd.tell()
         size = self._fd.seek(0, io.SEEK_END)
         self._fd.seek(pos)
         return size
 
     def read(self, size: Optional[int] = -1, /) -> AnyStr:
-        max_read = self._end - self._fd.tell()
+        if self._unbounded:
+            return self._read(size)
+        max_read = max(0, self._end - self._tell())  # The position can be past the end
         if size is None or size < 0 or size > max_read:
             size = max_read
-        return self._fd.read(size)
+        return self._read(size)
+
+    def readinto(self, buffer: WriteableBuffer, /) -> int:
+        if self._unbounded:
+            return self._fd.readinto(buffer)  # type: ignore
+        max_read = max(0, self._end - self._tell())  # A negative one would slice from the end
+        with memoryview(buffer).cast('B') as view:
+            return self._fd.readinto(view[:max_read])  # type: ignore
 
     def seek(self, offset: int, whence: int = io.SEEK_SET, /) -> int:
-        if whence == io.SEEK_SET:
-            offset = max(self._start, offset + self._start)
-        elif whence == io.SEEK_CUR:
-            pos = self._fd.tell()
-            if pos + offset > self._end:  # Positive offset
-                offset = self._end - pos
-            elif pos + offset < self._start:  # Negative offset
-                offset = pos - self._start
-        elif whence == io.SEEK_END:
-            whence = io.SEEK_SET
-            offset = min(self._end, offset + self._end)
-        return self._fd.seek(offset, whence) - self._start
+        if whence == io.SEEK_SET:  # The only one used when reading an image
+            return self._fd.seek(max(self._start, offset + self._start)) - self._start
+        if whence == io.SEEK_CUR:
+            return self._seek_cur(offset)
+        if whence == io.SEEK_END:
+            return self._seek_end(offset)
+        return self._fd.seek(offset, whence) - self._start  # Let the stream handle it
+
+    def _seek_cur(self, offset: int) -> int:
+        pos = self._tell()
+        if pos + offset > self._end:  # Positive offset
+            offset = self._end - pos
+        elif pos + offset < self._start:  # Negative offset
+            offset = self._start - pos
+        return self._fd.seek(offset, io.SEEK_CUR) - self._start
+
+    def _seek_end(self, offset: int) -> int:
+        return self._fd.seek(min(self._end, offset + self._end)) - self._start
 
     def tell(self) -> int:
-        return self._fd.tell() - self._start
+        return self._tell() - self._start
+
+
+def real_fileno(fd: Any) -> Optional[int]:
+    """Return the file descriptor of `fd` if reading or writing `fd` uses it directly, else None.
+
+    Streams like `gzip.GzipFile` also have a `fileno()`,
+    but it's the one of the compressed file.
+    """
+    if isinstance(fd, BoundedSubStream):
+        fd = fd._fd
+    if isinstance(fd, (io.BufferedReader, io.BufferedWriter, io.BufferedRandom)):
+        fd = fd.raw
+    if not isinstance(fd, io.FileIO):
+        return None
+    try:
+        return fd.fileno()
+    except ValueError:  # Closed
+        return None
+
+
+def _multmodp(a: int, b: int) -> int:
+    """Multiply a and b modulo the CRC polynomial (reflected bit order)."""
+    m = 1 << 31
+    p = 0
+    while True:
+        if a & m:
+            p ^= b
+            if a & (m - 1) == 0:
+                break
+        m >>= 1
+        b = (b >> 1) ^ CRC_POLY if b & 1 else b >> 1
+    return p
+
+
+def _x2nmodp(n: int) -> int:
+    """Return x^(8n) modulo the CRC polynomial, i.e. n zero bytes."""
+    p = 1 << 31  # x^0
+    x2n = _multmodp(1 << 30, 1 << 30)  # x^2
+    x2n = _multmodp(x2n, x2n)  # x^4
+    x2n = _multmodp(x2n, x2n)  # x^8
+    while n:
+        if n & 1:
+            p = _multmodp(x2n, p)
+        n >>= 1
+        x2n = _multmodp(x2n, x2n)
+    return p
+
+
+def crc32_combine(crc1: int, crc2: int, len2: int) -> int:
+    """Combine the CRC32 of two sequences of bytes,
+    `len2` being the length of the second one.
+
+    Same as zlib's crc32_combine().
+    """
+    return _multmodp(_x2nmodp(len2), crc1) ^ crc2
+
+
+def parallel_crc32(data: memoryview, crc: int = 0, size: int = 1024**2) -> int:
+    """Update `crc` with the CRC32 of `data` using multiple threads.
+
+    `data` is split in slices of at least `size` bytes whose CRCs
+    are calculated concurrently (crc32 releases the GIL) and then combined.
+    """
+    workers = min(os.cpu_count() or 1, len(data) // size)
+    if workers < 2:
+        return crc32(data, crc)
+    step = -(-len(data) // workers)
+    step += -step % 0x10000  # Round up to 64 KiB
+    slices = [data[start:start + step] for start in range(0, len(data), step)]
+    with ThreadPoolExecutor(len(slices)) as executor:
+        crcs = list(executor.map(crc32, slices))
+    for slice_, slice_crc in zip(slices, crcs):
+        crc = crc32_combine(crc, slice_crc, len(slice_))
+        slice_.release()
+    return crc
 
 
 def find_superblocks(
-    file_or_bytes: Union[FileDescriptorOrPath, ReadableBuffer],
-    size: int = 1024**2
+    file_or_bytes: Union[FileDescriptorOrPath, ReadableBuffer, BinaryIO],
+    size: int = 4 * 1024**2
 ) -> List[StructAsDict]:
     """Return a list of dictionaries representing the
     superblocks found in the file with their offset.
+
+    A binary stream (e.g. a pipe) is read from its current position
+    `size` bytes at a time and the offsets are relative to that position.
+    Files that can't be memory-mapped are read the same way.
     """
-    indexes: Set[int] = set()
-    result: List[StructAsDict] = []
+    if isinstance(file_or_bytes, (bytes, bytearray)):
+        return _search_superblocks(file_or_bytes)
     if isinstance(file_or_bytes, (str, Path)):
-        stream = open(file_or_bytes, "rb")
-    elif isinstance(file_or_bytes, (bytes, bytearray)):
-        stream = io.BytesIO(file_or_bytes)
-    else:
-        raise TypeError("argument must be a path or bytes")
-    with stream as f:
-        prev_block = b''
-        for count, next_block in enumerate(iter(partial(f.read, size), b'')):
-            # We don't want to "cut" in the middle of a magic.
-            block = prev_block + next_block
-            index = block.find(MAGIC_BYTES)
-            if index != -1:
-                indexes.add(index + (count * size) - len(prev_block))
-            prev_block = next_block[-(len(MAGIC_BYTES) - 1) :]
-        for index in sorted(indexes):
-            f.seek(index)
-            super = Super.from_fd(f)
-            # It's possible that the magic shows up but is just random bytes.
-            # That's why we dont decode() the signature and compare the raw bytes.
-            if super.magic == MAGIC and super._signature == SIGNATURE_BYTES:  # type: ignore
-                result.append(dict(super, offset=index))
+        with open(file_or_bytes, "rb") as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # Not a real file or empty file
+                return _search_stream(f, size)
+            # Let the OS page the file in and search it in a single pass.
+            with mm:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):  # Not available on Windows
+                    mm.madvise(mmap.MADV_SEQUENTIAL)  # Read ahead aggressively
+                return _search_superblocks(mm)
+    if hasattr(file_or_bytes, "read"):
+        return _search_stream(file_or_bytes, size)  # type: ignore
+    raise TypeError("argument must be a path, bytes or a binary stream")
+
+
+def _search_stream(fd: BinaryIO, size: int) -> List[StructAsDict]:
+    """Find the superblocks in a stream that is read `size` bytes at a time."""
+    result: List[StructAsDict] = []
+    search, carry, read = _search_superblocks, SUPER.size - 1, fd.read  # Avoid lookups in the loop
+    prev_block = b''
+    start = 0  # Position of the block in the stream
+    while next_block := read(size):
+        # We don't want to "cut" in the middle of a superblock.
+        block = prev_block + next_block
+        result += search(block, start)
+        # Keep the bytes where a superblock could start without fitting in this block.
+        keep = min(len(block), carry)
+        prev_block = block[len(block) - keep :]
+        start += len(block) - keep
+    return result
+
+
+def _search_superblocks(buffer: Union[ReadableBuffer, mmap.mmap], start: int = 0) -> List[StructAsDict]:
+    """Find the superblocks in a buffer that is entirely in memory (or mapped).
+
+    `start` is the offset of the buffer in the file.
+    """
+    result: List[StructAsDict] = []
+    # Look for the signature rather than the magic: being longer, it's
+    # found faster and is much less likely to show up by chance.
+    find, unpack_from, signature = buffer.find, SUPER.unpack_from, SIGNATURE_BYTES  # type: ignore
+    end = len(buffer) - SUPER.size + SIGNATURE_OFFSET
+    index = find(signature, SIGNATURE_OFFSET)
+    while index != -1 and index <= end:
+        offset = index - SIGNATURE_OFFSET
+        if superblock := _superblock_dict(unpack_from(buffer, offset), start + offset):
+            result.append(superblock)
+        index = find(signature, index + 1)
     return result
 
 
+def _superblock_dict(fields: Tuple[Any, ...], offset: int) -> Optional[StructAsDict]:
+    """Build the same dictionary as `dict(Super)` from the unpacked `SUPER` fields.
+
+    Return None if they aren't those of a superblock.
+    """
+    magic, size, flags, future, signature, crc, edition, blocks, files, name, *root = fields
+    # It's possible that the magic shows up but is just random bytes.
+    # That's why we dont decode() the signature and compare the raw bytes.
+    if magic != MAGIC or signature != SIGNATURE_BYTES:
+        return None
+    mode_uid, size_gid, namelen_offset = root
+    return {
+        "magic": magic,
+        "size": size,
+        "flags": Flag(flags),
+        "future": future,
+        "signature": signature.decode(),
+        "fsid": {"crc": crc, "edition": edition, "blocks": blocks, "files": files},
+        "name": name.split(b'\x00', 1)[0].decode(),
+        "root": {
+            "mode": mode_uid & ((1 << Width.MODE) - 1),
+            "uid": mode_uid >> Width.MODE,
+            "size": size_gid & ((1 << Width.SIZE) - 1),
+            "gid": size_gid >> Width.SIZE,
+            "namelen": (namelen_offset & ((1 << Width.NAMELEN) - 1)) * 4,
+            "offset": (namelen_offset >> Width.NAMELEN) * 4,
+        },
+        "offset": offset,
+    }
+
+
 def test_super(superblock: Super) -> None:
-    if superblock.magic != MAGIC:
-        raise CramfsError("wrong magic")
-    if superblock.signature != SIGNATURE:
-        raise CramfsError("wrong signature")
-    if superblock.flags & ~SUPPORTED_FLAGS:
-        raise CramfsError("unsupported filesystem features")
+    # Compare the raw signature, garbage may not even decode.
+    if (superblock.magic, superblock._signature) != (MAGIC, SIGNATURE_BYTES):  # type: ignore
+        raise CramfsError("wrong magic" if superblock.magic != MAGIC else "wrong signature")
+    flags = superblock._flags  # type: ignore  # Plain int, no Flag for each check
+    if unsupported := flags & ~SUPPORTED_FLAGS:
+        raise CramfsError(f"unsupported filesystem features ({unsupported:#x})")
     if superblock.size < PAGE_SIZE:
         raise CramfsError(f"superblock size {superblock.size} too small")
-    if superblock.flags & Flag.FSID_VERSION_2:
+    if flags & Flag.FSID_VERSION_2:
         if superblock.fsid.files == 0:
             raise CramfsError("zero file count")
     else:
-        print("WARNING: old cramfs format")
+        warnings.warn("old cramfs format", stacklevel=2)
 
 
 def printq(*args: object, quiet: bool = False, **kwargs: Any) -> None:
     if not quiet:
         print(*args, **kwargs)
+
+
+def _noop(*args: object, **kwargs: Any) -> None:
+    pass
+
+
+def printer(quiet: bool = False) -> Callable[..., None]:
+    """Return `print`, or a function that does nothing if `quiet` is true.
+
+    Use this instead of `printq` when printing many times.
+    """
+    return _noop if quiet else print